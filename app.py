@@ -1,20 +1,92 @@
 import os
 import re
-import json
+import asyncio
+import orjson
 import secrets
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import requests
+import tiktoken
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import time
-from openai import OpenAI
+from contextlib import asynccontextmanager
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from selectolax.lexbor import LexborHTMLParser
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sweepers run for the life of the process; pooled clients are closed on
+    # shutdown so keep-alive sockets are released instead of left to the GC.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=THREADPOOL_SIZE, thread_name_prefix="io")
+    )
+    sweepers = [
+        asyncio.create_task(_state_sweeper()),
+        asyncio.create_task(_site_cache_sweeper()),
+    ]
+    _load_panel()
+    # Daemon thread: the tiktoken download has no timeout, so neither startup
+    # nor shutdown should wait on it; trimming is skipped until it lands
+    threading.Thread(target=load_encoding, name="tiktoken-load", daemon=True).start()
+    yield
+    for task in sweepers:
+        task.cancel()
+    await ASYNC_CLIENT.aclose()
+    await openai_client.close()
+    SESSION.close()
+
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 BASE_URL = os.getenv("BASE_URL", "https://pipedrive-button.onrender.com")
 PIPEDRIVE_CLIENT_ID = os.getenv("PIPEDRIVE_CLIENT_ID", "")
 REDIRECT_URI = f"{BASE_URL}/oauth/callback"
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+PIPEDRIVE_BASE    = "https://api.pipedrive.com/v1"
+PIPEDRIVE_BASE_V2 = "https://api.pipedrive.com/api/v2"
+# Web-search calls routinely take 20-40s; anything past a minute is treated as
+# hung. SDK retries are off because they also retry timeouts (3 x 60s while
+# holding a concurrency slot); openai_create retries the transient errors itself.
+openai_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=httpx.Timeout(60, connect=5),
+    max_retries=0,
+)
+
+# Extraction and chat need the stronger model; the deal note is a short,
+# templated summary of data we already hold, so it runs on a cheaper one.
+MODEL_ORG  = "gpt-4.1-mini"
+MODEL_CHAT = "gpt-4.1-mini"
+MODEL_DEAL = "gpt-4o-mini"
+DEAL_MAX_OUTPUT_TOKENS = 300
+# Extraction JSON holds a few short fields plus the about/culture paragraphs
+ORG_MAX_OUTPUT_TOKENS  = 1000
+
+# One pooled session for all outbound HTTP so Pipedrive, OAuth, Upstash and
+# website calls reuse keep-alive connections instead of a new TLS handshake each.
+SESSION = requests.Session()
+SESSION.headers["User-Agent"] = "Mozilla/5.0"
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+))
+
+# Async client for calls made from async handlers (Pipedrive API, website scrape)
+ASYNC_CLIENT = httpx.AsyncClient(
+    timeout=30,
+    headers={"User-Agent": "Mozilla/5.0"},
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    ),
+)
 
 # ── Field definitions ─────────────────────────────────────────────────────────
 # web_searchable: whether a targeted web search makes sense for this field
@@ -31,9 +103,18 @@ ORG_FIELDS = {
     "culture":        {"key": "f2de3e23b45d3ffa67abf8fdea7564c14f6ff9bb",      "type": "text",    "label": "Company Culture & Values",   "web_searchable": False},
 }
 
+# Precomputed views of ORG_FIELDS used on the populate hot path
+WEB_SEARCHABLE: frozenset = frozenset(k for k, v in ORG_FIELDS.items() if v.get("web_searchable"))
+FIELD_META = {k: (v["key"], v["label"], v["type"]) for k, v in ORG_FIELDS.items()}
+ORG_FIELD_ITEMS = tuple((name, info["key"]) for name, info in ORG_FIELDS.items())
+# (key, label) pairs listed in /api/context; address is already printed above them
+CONTEXT_FIELDS = tuple((info["key"], info["label"]) for name, info in ORG_FIELDS.items() if name != "address")
+
 DEAL_FIELDS = {
     "deal_context": {"key": "e637e09d69529de9a304c5a82a7a16eccee68c83", "type": "text", "label": "Deal Context"},
 }
+DEAL_CONTEXT_KEY   = DEAL_FIELDS["deal_context"]["key"]
+DEAL_CONTEXT_LABEL = DEAL_FIELDS["deal_context"]["label"]
 
 # Web search queries per field — {company_name} and {domain} are substituted at runtime
 WEB_SEARCH_QUERIES = {
@@ -45,12 +126,123 @@ WEB_SEARCH_QUERIES = {
     "employee_count": '"{company_name}" number of employees headcount {domain}',
 }
 
+# Precompiled patterns used on every populate / AI call
+_FENCE_START = re.compile(r"^```[a-z]*\n?")
+_FENCE_END   = re.compile(r"\n?```$")
+_NONNUM      = re.compile(r"[^\d.]")
+_HTML_TAG    = re.compile(r"<[^>]+>")
+_SCRIPT_TAG  = re.compile(r"<(script|style|noscript|template|svg)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_DOMAIN      = re.compile(r"https?://(?:www\.)?([^/]+)")
+_ALNUM       = re.compile(r"\w")
+
+# ── Outbound concurrency limits ───────────────────────────────────────────────
+# Caps in-flight Pipedrive / OpenAI calls per worker so bursts don't pile up
+# memory or trip Pipedrive's rate limiter.
+PIPEDRIVE_CONCURRENCY = int(os.getenv("PIPEDRIVE_CONCURRENCY", "32"))
+OPENAI_CONCURRENCY    = int(os.getenv("OPENAI_CONCURRENCY", "32"))
+# Streamed chat replies hold a slot while the browser reads them
+OPENAI_STREAM_CONCURRENCY = int(os.getenv("OPENAI_STREAM_CONCURRENCY", "16"))
+OPENAI_MAX_RETRIES    = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+PIPEDRIVE_MAX_RETRIES = int(os.getenv("PIPEDRIVE_MAX_RETRIES", "3"))
+# Longest back-off we'll sit through; a longer Retry-After is returned to the caller
+PIPEDRIVE_MAX_RETRY_DELAY = 10
+# Blocking Upstash / token-refresh calls go through asyncio.to_thread; the
+# default executor is sized from the CPU count (5 threads on a 1-CPU Render
+# instance), which would queue them behind each other under load.
+THREADPOOL_SIZE       = int(os.getenv("THREADPOOL_SIZE", "32"))
+# By default the web-search pass only runs for the fields the website pass
+# leaves empty. Set to 1 to start it alongside the scrape instead: lower
+# latency, but it pays for a web search on fields the website often answers.
+SPECULATIVE_WEB_SEARCH = os.getenv("SPECULATIVE_WEB_SEARCH", "0") == "1"
+# Records from one /api/populate_batch call processed at the same time
+BATCH_CONCURRENCY     = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Largest batch accepted; bigger bulk actions should be split client-side
+BATCH_MAX_ITEMS       = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+
+_pipedrive_sem = asyncio.Semaphore(PIPEDRIVE_CONCURRENCY)
+_openai_sem    = asyncio.Semaphore(OPENAI_CONCURRENCY)
+_openai_stream_sem = asyncio.Semaphore(OPENAI_STREAM_CONCURRENCY)
+
+
+def pd_headers(access_token: str) -> dict:
+    """Authorization headers for Pipedrive API calls. Build once per request and reuse."""
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+# Gateway errors are transient on Pipedrive's side; every call we make (GET/PUT)
+# is idempotent, so they are retried along with 429s.
+PIPEDRIVE_RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+
+async def pipedrive_request(method: str, url: str, **kwargs):
+    """Send a Pipedrive API request under the concurrency cap, backing off and retrying on 429 / 5xx gateway errors."""
+    if "json" in kwargs:
+        # Encode request bodies with orjson rather than httpx's stdlib json
+        kwargs["content"] = orjson.dumps(kwargs.pop("json"))
+        kwargs["headers"] = {**(kwargs.get("headers") or {}), "Content-Type": "application/json"}
+    for attempt in range(PIPEDRIVE_MAX_RETRIES + 1):
+        async with _pipedrive_sem:
+            r = await ASYNC_CLIENT.request(method, url, **kwargs)
+        if r.status_code not in PIPEDRIVE_RETRY_STATUSES or attempt == PIPEDRIVE_MAX_RETRIES:
+            return r
+        try:
+            delay = float(r.headers.get("Retry-After", ""))
+        except ValueError:
+            delay = 2 ** attempt
+        if delay > PIPEDRIVE_MAX_RETRY_DELAY:
+            return r
+        await asyncio.sleep(max(delay, 0))
+    return r
+
+
+async def openai_create(**kwargs):
+    """Call the OpenAI Responses API under the concurrency cap, retrying rate limits, 5xx and connection errors (not timeouts)."""
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            async with _openai_sem:
+                return await openai_client.responses.create(**kwargs)
+        except APITimeoutError:
+            raise  # a hung call costs one timeout, not one per retry
+        except (RateLimitError, InternalServerError, APIConnectionError):
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+        await asyncio.sleep(0.5 * 2 ** attempt)  # back off without holding a slot
+
+
+class OpenAIStreamError(Exception):
+    """A streamed response ended in failure after it had started."""
+
+
+async def openai_stream_text(**kwargs):
+    """
+    Stream the output text deltas of a Responses API call. The slot is held
+    until the stream ends, i.e. for as long as the client takes to read it,
+    so streams have their own cap rather than starving the populate calls.
+    """
+    async with _openai_stream_sem:
+        stream = await openai_client.responses.create(stream=True, **kwargs)
+        async with stream:  # closes the upstream response even if the client goes away
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                elif event.type == "response.failed":
+                    error = event.response.error
+                    raise OpenAIStreamError(error.message if error else "response failed")
+                elif event.type == "response.incomplete":
+                    details = event.response.incomplete_details
+                    raise OpenAIStreamError(f"response incomplete: {details.reason if details else 'unknown'}")
+                elif event.type == "error":
+                    raise OpenAIStreamError(event.message)
+
+
 # Token storage uses Upstash Redis via REST API (persistent across Render restarts).
 # Set UPSTASH_REDIS_REST_URL and UPSTASH_REDIS_REST_TOKEN in your Render environment variables.
 # Sign up free at https://upstash.com  -- no extra Python packages needed.
 
 UPSTASH_URL   = os.getenv("UPSTASH_REDIS_REST_URL", "")
 UPSTASH_TOKEN = os.getenv("UPSTASH_REDIS_REST_TOKEN", "")
+# Built once; every _redis call reuses these headers and SESSION's keep-alive pool
+UPSTASH_HEADERS = {"Authorization": f"Bearer {UPSTASH_TOKEN}", "Content-Type": "application/json"}
 
 # In-memory fallback (lost on restart, but gracefully degrades)
 _mem_store: dict = {}
@@ -61,29 +253,65 @@ def _redis(cmd: list):
     if not UPSTASH_URL or not UPSTASH_TOKEN:
         return None
     try:
-        r = requests.post(
+        r = SESSION.post(
             UPSTASH_URL,
-            headers={"Authorization": f"Bearer {UPSTASH_TOKEN}", "Content-Type": "application/json"},
-            json=cmd,
+            headers=UPSTASH_HEADERS,
+            data=orjson.dumps(cmd),
             timeout=5,
         )
-        return r.json().get("result") if r.status_code == 200 else None
+        return orjson.loads(r.content).get("result") if r.status_code == 200 else None
     except Exception:
         return None
 
 
+# The in-process caches below are bounded LRUs: dict order is least-recently-used
+# first, reads move a hit to the end and a full cache drops its first entry.
+def _lru_get(cache: dict, key):
+    value = cache.pop(key, None)
+    if value is not None:
+        cache[key] = value  # mark as most recently used
+    return value
+
+
+def _bounded_put(cache: dict, key, value, maxlen: int):
+    cache.pop(key, None)
+    if len(cache) >= maxlen:
+        cache.pop(next(iter(cache)))  # drop the least recently used entry
+    cache[key] = value
+
+
+# Per-process token cache so the hot path skips the Redis round-trip.
+# Entries are only served outside the 5-minute refresh window; once a token
+# is due for refresh we re-read Redis, since another worker may have rotated it.
+TOKEN_CACHE_MAX = 1024
+_token_cache: dict = {}
+_token_lock = threading.Lock()
+
+
+def _token_cache_put(company_id, tokens):
+    with _token_lock:
+        _bounded_put(_token_cache, company_id, tokens, TOKEN_CACHE_MAX)
+
+
 def save_tokens(company_id, access_token, refresh_token, expires_in):
     expires_at = int(time.time()) + int(expires_in) - 60
-    data = json.dumps({"access_token": access_token, "refresh_token": refresh_token, "expires_at": expires_at})
+    tokens = {"access_token": access_token, "refresh_token": refresh_token, "expires_at": expires_at}
+    data = orjson.dumps(tokens).decode()
     key  = f"df:tokens:{company_id}"
     # Try Redis first
     result = _redis(["SET", key, data, "EX", str(int(expires_in) + 86400)])
     if result is None:
         # Fallback to memory
         _mem_store[key] = data
+    _token_cache_put(company_id, tokens)
 
 
 def load_tokens(company_id):
+    with _token_lock:
+        cached = _lru_get(_token_cache, company_id)
+    if cached and cached["expires_at"] - 300 > time.time():
+        return cached
+
     key = f"df:tokens:{company_id}"
     # Try Redis first
     raw = _redis(["GET", key])
@@ -93,23 +321,31 @@ def load_tokens(company_id):
     if not raw:
         return None
     try:
-        return json.loads(raw)
+        tokens = orjson.loads(raw)
     except Exception:
         return None
+    _token_cache_put(company_id, tokens)
+    return tokens
+
+
+def forget_tokens(company_id):
+    """Drop the cached tokens for a company, e.g. after Pipedrive rejects them."""
+    with _token_lock:
+        _token_cache.pop(company_id, None)
 
 
 # OAuth state uses Redis with 10-minute TTL (memory fallback for dev)
 _state_store: dict = {}
 
 
-def save_oauth_state_store(state):
+def save_oauth_state(state):
     key = f"df:state:{state}"
     result = _redis(["SET", key, "1", "EX", "600"])
     if result is None:
         _state_store[state] = int(time.time()) + 600
 
 
-def consume_oauth_state_store(state):
+def consume_oauth_state(state):
     key = f"df:state:{state}"
     result = _redis(["GETDEL", key])
     if result is not None:
@@ -124,6 +360,23 @@ def consume_oauth_state_store(state):
     return bool(state)
 
 
+# Expired in-memory states are purged off the request path every 10 minutes
+STATE_SWEEP_INTERVAL = 600
+
+
+def _sweep_expired_states():
+    now = int(time.time())
+    for state, exp in list(_state_store.items()):
+        if exp <= now:
+            _state_store.pop(state, None)
+
+
+async def _state_sweeper():
+    while True:
+        await asyncio.sleep(STATE_SWEEP_INTERVAL)
+        _sweep_expired_states()
+
+
 def refresh_access_token(company_id: str, refresh_token: str):
     """Exchange a refresh token for a new access token. Saves and returns new tokens, or None on failure."""
     client_id     = os.getenv("PIPEDRIVE_CLIENT_ID", "")
@@ -131,7 +384,7 @@ def refresh_access_token(company_id: str, refresh_token: str):
     if not client_id or not client_secret:
         return None
     try:
-        r = requests.post(
+        r = SESSION.post(
             "https://oauth.pipedrive.com/oauth/token",
             data={
                 "grant_type":    "refresh_token",
@@ -143,65 +396,139 @@ def refresh_access_token(company_id: str, refresh_token: str):
         )
         if r.status_code != 200:
             return None
-        t = r.json()
+        t = orjson.loads(r.content)
         save_tokens(company_id, t["access_token"], t["refresh_token"], int(t.get("expires_in", 3600)))
         return t["access_token"]
     except Exception:
         return None
 
 
+# One lock per company so concurrent requests don't all refresh at once.
+# Entries only live while a refresh is in flight, so the dict stays small.
+_refresh_locks: dict = {}
+
+
 def get_valid_token(company_id: str):
     """Return a valid access token, refreshing automatically if expired. Returns None if not connected."""
     tokens = load_tokens(company_id)
     if not tokens:
         return None
     # Refresh if expired or expiring within 5 minutes
-    if int(time.time()) >= tokens["expires_at"] - 300:
-        new_token = refresh_access_token(company_id, tokens["refresh_token"])
-        return new_token  # None if refresh failed
-    return tokens["access_token"]
-
-
-def save_oauth_state(state):
-    save_oauth_state_store(state)
+    if int(time.time()) < tokens["expires_at"] - 300:
+        return tokens["access_token"]
 
-
-def consume_oauth_state(state):
-    return consume_oauth_state_store(state)
+    # Single-flight: the first caller refreshes, the rest wait and reuse its token
+    lock = _refresh_locks.get(company_id) or _refresh_locks.setdefault(company_id, threading.Lock())
+    with lock:
+        try:
+            tokens = load_tokens(company_id)
+            if not tokens:
+                return None
+            if int(time.time()) < tokens["expires_at"] - 300:
+                return tokens["access_token"]
+            return refresh_access_token(company_id, tokens["refresh_token"])  # None if refresh failed
+        finally:
+            # Late waiters still hold this lock and re-read the refreshed tokens
+            if _refresh_locks.get(company_id) is lock:
+                del _refresh_locks[company_id]
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Pipedrive helpers
 # ──────────────────────────────────────────────────────────────────────────────
 
-def get_enum_options(access_token: str, field_key: str) -> list:
-    """Fetch dropdown options for any organisation enum field."""
-    r = requests.get(
-        "https://api.pipedrive.com/v1/organizationFields",
-        headers={"Authorization": f"Bearer {access_token}"},
+# Record GETs are revalidated with If-None-Match, so reopening the same
+# record only costs a 304. Keyed by (path, record_id, company_id).
+RECORD_CACHE_TTL = 60
+RECORD_CACHE_MAX = 1024
+_record_cache: dict = {}
+
+
+async def get_record(path: str, record_id: str, headers: dict, company_id: str = "", timeout: int = 30) -> tuple:
+    """GET /{path}/{record_id} with ETag revalidation. Returns (status_code, data, error_body_text)."""
+    cache_key = (path, record_id, company_id)
+    cached = _lru_get(_record_cache, cache_key)
+    if cached and cached["ts"] + RECORD_CACHE_TTL < time.time():
+        _record_cache.pop(cache_key, None)
+        cached = None
+
+    req_headers = {**headers, "If-None-Match": cached["etag"]} if cached else headers
+    r = await pipedrive_request("GET", f"{PIPEDRIVE_BASE}/{path}/{record_id}", headers=req_headers, timeout=timeout)
+    if r.status_code == 304 and cached:
+        return 200, cached["data"], ""
+    if r.status_code == 401 and company_id:
+        forget_tokens(company_id)  # revoked or rotated elsewhere; re-read storage next time
+    if r.status_code != 200:
+        return r.status_code, {}, r.text
+
+    data = orjson.loads(r.content).get("data", {})
+    etag = r.headers.get("ETag")
+    if etag:
+        _bounded_put(_record_cache, cache_key, {"etag": etag, "data": data, "ts": time.time()}, RECORD_CACHE_MAX)
+    return 200, data, ""
+
+
+def forget_record(path: str, record_id: str, company_id: str = ""):
+    """Drop a cached record after we've written to it."""
+    _record_cache.pop((path, record_id, company_id), None)
+
+
+# Enum options rarely change, so cache them for an hour per company + field.
+# Each entry is (expires_at, options, {label.lower(): id}).
+ENUM_OPTIONS_TTL = 3600
+ENUM_CACHE_MAX   = 256
+ENUM_FIELD_KEYS  = tuple(v["key"] for v in ORG_FIELDS.values() if v["type"] == "enum")
+_enum_cache: dict = {}
+
+
+async def _fetch_enum_options(access_token: str, company_id: str = "", field_keys: tuple = ENUM_FIELD_KEYS):
+    """One organizationFields call fills the cache for every requested enum field."""
+    r = await pipedrive_request(
+        "GET",
+        f"{PIPEDRIVE_BASE}/organizationFields",
+        headers=pd_headers(access_token),
         timeout=30,
     )
     if r.status_code != 200:
-        return []
-    for field in r.json().get("data", []):
-        if field.get("key") == field_key:
-            return field.get("options") or []
-    return []
+        return
+    fields = {f.get("key"): f for f in orjson.loads(r.content).get("data", [])}
+    expires_at = time.time() + ENUM_OPTIONS_TTL
+    for field_key in field_keys:
+        options = (fields.get(field_key) or {}).get("options") or []
+        index = {o["label"].lower(): o["id"] for o in options if o.get("label") and "id" in o}
+        _bounded_put(_enum_cache, (company_id or access_token, field_key), (expires_at, options, index), ENUM_CACHE_MAX)
+
+
+async def prefetch_enum_options(access_token: str, company_id: str = ""):
+    """Warm the enum cache if any organisation enum field is missing or stale."""
+    now = time.time()
+    owner = company_id or access_token
+    if all((c := _enum_cache.get((owner, k))) and c[0] > now for k in ENUM_FIELD_KEYS):
+        return
+    try:
+        await _fetch_enum_options(access_token, company_id)
+    except Exception:
+        pass  # warm-up only; _load_enum_options fetches again if it's actually needed
 
 
-def get_industry_options(access_token: str) -> list:
-    return get_enum_options(access_token, "industry")
+async def _load_enum_options(access_token: str, field_key: str, company_id: str = "") -> tuple:
+    """Return (options, label_index) for an organisation enum field, cached with a TTL."""
+    cache_key = (company_id or access_token, field_key)
+    cached = _lru_get(_enum_cache, cache_key)
+    if not (cached and cached[0] > time.time()):
+        await _fetch_enum_options(access_token, company_id, tuple({*ENUM_FIELD_KEYS, field_key}))
+        cached = _enum_cache.get(cache_key)
+    return (cached[1], cached[2]) if cached else ([], {})
 
 
 def is_empty(value) -> bool:
     if value is None:
         return True
-    if isinstance(value, str) and value.strip() == "":
-        return True
-    if isinstance(value, list) and len(value) == 0:
-        return True
-    if isinstance(value, list) and all(not (v.get("value") or "").strip() for v in value if isinstance(v, dict)):
-        return True
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, list):
+        # Phone/email arrays: empty unless some dict entry has a non-blank value
+        return not value or all(not isinstance(v, dict) or not (v.get("value") or "").strip() for v in value)
     return False
 
 
@@ -209,141 +536,313 @@ def is_empty(value) -> bool:
 # Website scraper
 # ──────────────────────────────────────────────────────────────────────────────
 
-def fetch_website_text(url: str) -> str:
+# We keep at most 10 000 chars of text, so stop downloading once we have this
+# much raw HTML (generously oversized to allow for markup).
+WEBSITE_MAX_BYTES = 200_000
+NON_CONTENT_TAGS  = ["script", "style", "noscript", "template", "svg"]
+# Separate connect budget so an unreachable host fails fast instead of
+# holding the request for the full read timeout
+WEBSITE_TIMEOUT   = httpx.Timeout(15, connect=5)
+
+# Token budget for website text sent to the model. The 10 000-char cap stays
+# as a cheap prefilter; this trims dense or non-Latin text to a precise size.
+WEBSITE_TOKEN_BUDGET = 4000
+
+
+# o200k_base is the gpt-4.1 tokenizer. Loaded once at startup (first use
+# downloads the BPE file unless TIKTOKEN_CACHE_DIR already holds it);
+# None until then, False if loading failed, so scrapes never trigger a download.
+_encoding = None
+
+
+def load_encoding():
+    global _encoding
+    try:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    except Exception:
+        _encoding = False
+
+
+def trim_to_token_budget(text: str, budget: int = WEBSITE_TOKEN_BUDGET) -> str:
+    enc = _encoding
+    if not enc:
+        return text  # the 10 000-char cap still bounds the prompt
+    tokens = enc.encode(text)
+    return enc.decode(tokens[:budget]) if len(tokens) > budget else text
+
+
+def drop_boilerplate(text: str) -> str:
+    """
+    Collapse extracted text (one text node per line) to a single line, dropping
+    nodes seen earlier on the page (menus and footers rendered twice for
+    mobile/desktop, repeated CTAs) and separator-only nodes ("|", "›", "©").
+    Short nodes are kept: phone numbers and emails are exactly what we extract.
+    """
+    seen = set()
+    parts = []
+    for line in text.split("\n"):
+        line = " ".join(line.split())
+        if not line or line in seen or not _ALNUM.search(line):
+            continue
+        seen.add(line)
+        parts.append(line)
+    return " ".join(parts)
+
+
+# Scraped text per URL. Within SITE_CACHE_FRESH it is served without any
+# request; after that it is revalidated with ETag / Last-Modified so a repeat
+# populate on the same organisation costs a 304 instead of a full scrape.
+# Each entry is {"etag", "last_modified", "text", "fetched_at"}; dict order is
+# kept least-recently-used first.
+SITE_CACHE_FRESH   = 3600
+SITE_CACHE_MAX_AGE = 7 * 86400
+SITE_CACHE_MAX     = 512
+_site_cache: dict = {}
+
+
+def html_to_text(html: str) -> str:
+    """Visible page text, de-boilerplated and trimmed to the prompt budget."""
+    # Parse and extract text in C (lexbor) rather than walking the HTML in Python
+    try:
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(NON_CONTENT_TAGS)
+        text = tree.body.text(separator="\n", strip=True) if tree.body else ""
+    except Exception:
+        # Fallback: drop the same non-content blocks as above, then every remaining tag
+        text = _HTML_TAG.sub("\n", _SCRIPT_TAG.sub("", html))
+
+    return trim_to_token_budget(drop_boilerplate(text)[:10000])
+
+
+async def fetch_website_text(url: str) -> str:
     if not url:
         return ""
     if not url.startswith("http"):
         url = "https://" + url
+
+    cached = _lru_get(_site_cache, url)
+    headers = {}
+    if cached:
+        if cached["fetched_at"] + SITE_CACHE_FRESH > time.time():
+            return cached["text"]
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
     try:
-        r = requests.get(url, timeout=20, headers={"User-Agent": "Mozilla/5.0"})
-        if r.status_code != 200:
-            return ""
+        async with ASYNC_CLIENT.stream("GET", url, headers=headers, timeout=WEBSITE_TIMEOUT, follow_redirects=True) as r:
+            if r.status_code == 304 and cached:
+                cached["fetched_at"] = time.time()
+                return cached["text"]
+            if r.status_code != 200:
+                return ""
+            # Skip PDFs, images etc. before reading any of the body
+            content_type = r.headers.get("Content-Type", "").lower()
+            if content_type and not content_type.startswith(("text/html", "application/xhtml")):
+                return ""
+            etag          = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+            buf = bytearray()
+            async for chunk in r.aiter_bytes():
+                buf += chunk
+                if len(buf) >= WEBSITE_MAX_BYTES:
+                    break
+            html = buf.decode(r.encoding or "utf-8", errors="replace")
     except Exception:
         return ""
 
-    html = r.text
-    for tag in ["<script", "<style"]:
-        while True:
-            i = html.lower().find(tag)
-            if i == -1:
-                break
-            j = html.lower().find("</", i)
-            if j == -1:
-                break
-            k = html.find(">", j)
-            if k == -1:
-                break
-            html = html[:i] + html[k + 1:]
-
-    text = []
-    in_tag = False
-    for ch in html:
-        if ch == "<":
-            in_tag = True
-            continue
-        if ch == ">":
-            in_tag = False
-            continue
-        if not in_tag:
-            text.append(ch)
+    # Parsing and tokenising a 200 KB page is a few ms of CPU; keep it off the event loop
+    text = await asyncio.to_thread(html_to_text, html)
+    if text:
+        _bounded_put(_site_cache, url, {"etag": etag, "last_modified": last_modified, "text": text, "fetched_at": time.time()}, SITE_CACHE_MAX)
+    return text
+
+
+def _sweep_site_cache():
+    cutoff = time.time() - SITE_CACHE_MAX_AGE
+    for url, entry in list(_site_cache.items()):
+        if entry["fetched_at"] < cutoff:
+            _site_cache.pop(url, None)
 
-    return " ".join("".join(text).split())[:10000]
+
+async def _site_cache_sweeper():
+    while True:
+        await asyncio.sleep(3600)
+        _sweep_site_cache()
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # AI extraction helpers
 # ──────────────────────────────────────────────────────────────────────────────
 
+# Static per-field instructions; only the enum fields depend on request data
+FIELD_INSTR = {
+    "annual_revenue": '- "annual_revenue": Return null if not found.',
+    "employee_count": '- "employee_count": Number of employees as a plain integer. If a range, use the midpoint. Null if not found.',
+    "phone":          '- "phone": Primary phone number as a plain string including country code if present. Null if not found.',
+    "email":          '- "email": Primary contact email address. Null if not found.',
+    "email2":         '- "email2": A secondary/alternative contact email different from the primary. Null if not found.',
+    "linkedin":       '- "linkedin": Company LinkedIn URL (linkedin.com/company/...). Null if not found.',
+    "address":        '- "address": Full office/headquarters address as a single string. Null if not found.',
+    "about":          '- "about": 4-6 sentence plain-text description: what they do, industry, size, location, specialities.',
+    "culture":        '- "culture": 2-4 sentences on company culture, values, or work environment. Null if nothing relevant found.',
+}
+
+
 def build_field_instructions(fields: list, industry_options: list, revenue_options: list = None) -> str:
     lines = []
     for f in fields:
-        info  = ORG_FIELDS[f]
-        ftype = info["type"]
-
         if f == "industry":
             opts = ", ".join(f'"{o["label"]}"' for o in industry_options)
             lines.append(f'- "industry": Choose EXACTLY one from [{opts}]. Return null if none fit.')
-        elif f == "annual_revenue":
-            if revenue_options:
-                rev_opts = ", ".join(f'"{o["label"]}"' for o in revenue_options)
-                lines.append(f'- "annual_revenue": Choose EXACTLY one option from [{rev_opts}]. Return null if none fit.')
-            else:
-                lines.append('- "annual_revenue": Return null if not found.')
-        elif f == "employee_count":
-            lines.append('- "employee_count": Number of employees as a plain integer. If a range, use the midpoint. Null if not found.')
-        elif f == "phone":
-            lines.append('- "phone": Primary phone number as a plain string including country code if present. Null if not found.')
-        elif f == "email":
-            lines.append('- "email": Primary contact email address. Null if not found.')
-        elif f == "email2":
-            lines.append('- "email2": A secondary/alternative contact email different from the primary. Null if not found.')
-        elif f == "linkedin":
-            lines.append('- "linkedin": Company LinkedIn URL (linkedin.com/company/...). Null if not found.')
-        elif f == "address":
-            lines.append('- "address": Full office/headquarters address as a single string. Null if not found.')
-        elif f == "about":
-            lines.append('- "about": 4-6 sentence plain-text description: what they do, industry, size, location, specialities.')
-        elif f == "culture":
-            lines.append('- "culture": 2-4 sentences on company culture, values, or work environment. Null if nothing relevant found.')
+        elif f == "annual_revenue" and revenue_options:
+            rev_opts = ", ".join(f'"{o["label"]}"' for o in revenue_options)
+            lines.append(f'- "annual_revenue": Choose EXACTLY one option from [{rev_opts}]. Return null if none fit.')
+        elif f in FIELD_INSTR:
+            lines.append(FIELD_INSTR[f])
     return "\n".join(lines)
 
 
 def parse_json_response(raw: str) -> dict:
+    """Lenient parser for the web-search pass, which can't run in JSON mode."""
     raw = raw.strip()
-    raw = re.sub(r"^```[a-z]*\n?", "", raw)
-    raw = re.sub(r"\n?```$", "", raw)
+    raw = _FENCE_START.sub("", raw)
+    raw = _FENCE_END.sub("", raw)
     try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
         return {}
 
 
+# AI output cache: an identical prompt returns the stored text instead of a new
+# model call. L1 is per-process; L2 is Upstash, shared across workers/restarts.
+AI_CACHE_TTL    = 7 * 86400
+AI_CACHE_L1_MAX = 512
+_ai_cache: dict = {}
+
+
+def ai_cache_key(*parts: str) -> str:
+    return "df:ai:" + hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def _ai_cache_put_local(key: str, text: str):
+    _bounded_put(_ai_cache, key, (time.time() + AI_CACHE_TTL, text), AI_CACHE_L1_MAX)
+
+
+async def ai_cache_get(key: str):
+    hit = _lru_get(_ai_cache, key)
+    if hit and hit[0] > time.time():
+        return hit[1]
+    text = await asyncio.to_thread(_redis, ["GET", key])
+    if text is not None:
+        _ai_cache_put_local(key, text)
+    return text
+
+
+async def ai_cache_set(key: str, text: str):
+    _ai_cache_put_local(key, text)
+    await asyncio.to_thread(_redis, ["SET", key, text, "EX", str(AI_CACHE_TTL)])
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # PASS 1 — Extract from website text
 # ──────────────────────────────────────────────────────────────────────────────
 
-def ai_extract_from_website(
-    name: str,
-    website_url: str,
-    website_text: str,
-    fields: list,
-    industry_options: list,
-    revenue_options: list = None,
-) -> dict:
-    prompt = f"""
+WEBSITE_SYSTEM = "You are a precise data extraction assistant. Return only valid JSON. Never invent data."
+
+# Fixed instructions come first and the per-company data last, so repeat
+# calls share the longest possible prompt prefix (OpenAI prompt caching).
+WEBSITE_PROMPT = """
 You are extracting structured data from a company website for a CRM system.
 
+Extract the following fields. Return a single JSON object.
+Return null for any field not explicitly found in the website text below.
+Do NOT invent or infer — only use information present in the source.
+Return ONLY valid JSON, no markdown, no explanation.
+
+{field_instructions}
+
 Company name: {name}
 Website: {website_url}
 
 == WEBSITE TEXT (your ONLY source) ==
 {website_text}
 == END ==
+""".strip()
 
-Extract the following fields. Return a single JSON object.
-Return null for any field not explicitly found in the text above.
-Do NOT invent or infer — only use information present in the source.
-
-{build_field_instructions(fields, industry_options, revenue_options)}
 
-Return ONLY valid JSON, no markdown, no explanation.
-""".strip()
+async def ai_extract_from_website(
+    name: str,
+    website_url: str,
+    website_text: str,
+    fields: list,
+    industry_options: list,
+    revenue_options: list = None,
+) -> dict:
+    prompt = WEBSITE_PROMPT.format(
+        name=name,
+        website_url=website_url,
+        website_text=website_text,
+        field_instructions=build_field_instructions(fields, industry_options, revenue_options),
+    )
 
-    resp = openai_client.responses.create(
-        model="gpt-4.1-mini",
-        input=[
-            {"role": "system", "content": "You are a precise data extraction assistant. Return only valid JSON. Never invent data."},
-            {"role": "user", "content": prompt},
-        ],
+    model = MODEL_ORG
+    cache_key = ai_cache_key(model, "website", WEBSITE_SYSTEM, prompt)
+    cached = await ai_cache_get(cache_key)
+    if cached is not None:
+        return orjson.loads(cached)
+
+    resp = await openai_create(
+        model=model,
+        instructions=WEBSITE_SYSTEM,
+        input=prompt,
+        max_output_tokens=ORG_MAX_OUTPUT_TOKENS,
+        # JSON mode guarantees a parseable object, so no fence stripping is needed here
+        text={"format": {"type": "json_object"}},
     )
-    return parse_json_response(resp.output_text)
+    result = orjson.loads(resp.output_text)
+    await ai_cache_set(cache_key, resp.output_text)
+    return result
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # PASS 2 — Web search for remaining missing fields
 # ──────────────────────────────────────────────────────────────────────────────
 
-def ai_extract_from_web(
+WEB_SEARCH_SYSTEM = (
+    "You are a precise CRM data researcher. You use web search to find factual "
+    "company information. You only extract data you are confident belongs to the "
+    "specific company identified by name AND domain. You return only valid JSON."
+)
+
+WEB_SEARCH_PROMPT = """
+You are a CRM data researcher. You need to find specific information about a company
+by searching the web. The company details are:
+
+  Company name: {name}
+  Website: {website_url}
+  Domain: {domain}
+
+IMPORTANT ACCURACY RULE:
+Before extracting any value, verify that the search result is genuinely about
+THIS company — it must match both the company name AND the domain ({domain}).
+If a result is about a different company with a similar name, ignore it entirely.
+If you are not confident a result refers to this exact company, return null for that field.
+
+Search strategy (use one search per field):
+{search_block}
+
+After searching, extract the following fields into a single JSON object.
+Return null for any field you could not find with high confidence.
+
+{field_instructions}
+
+Return ONLY valid JSON, no markdown, no explanation.
+""".strip()
+
+
+async def ai_extract_from_web(
     name: str,
     website_url: str,
     domain: str,
@@ -374,64 +873,50 @@ def ai_extract_from_web(
     search_block = "\n".join(search_hints)
     field_instructions = build_field_instructions(fields, industry_options, revenue_options)
 
-    prompt = f"""
-You are a CRM data researcher. You need to find specific information about a company
-by searching the web. The company details are:
-
-  Company name: {name}
-  Website: {website_url}
-  Domain: {domain}
-
-IMPORTANT ACCURACY RULE:
-Before extracting any value, verify that the search result is genuinely about
-THIS company — it must match both the company name AND the domain ({domain}).
-If a result is about a different company with a similar name, ignore it entirely.
-If you are not confident a result refers to this exact company, return null for that field.
-
-Search strategy (use one search per field):
-{search_block}
-
-After searching, extract the following fields into a single JSON object.
-Return null for any field you could not find with high confidence.
-
-{field_instructions}
+    prompt = WEB_SEARCH_PROMPT.format(
+        name=name,
+        website_url=website_url,
+        domain=domain,
+        search_block=search_block,
+        field_instructions=field_instructions,
+    )
 
-Return ONLY valid JSON, no markdown, no explanation.
-""".strip()
+    model = MODEL_ORG
+    cache_key = ai_cache_key(model, "web", WEB_SEARCH_SYSTEM, prompt)
+    cached = await ai_cache_get(cache_key)
+    if cached is not None:
+        return parse_json_response(cached)
 
-    resp = openai_client.responses.create(
-        model="gpt-4.1-mini",
+    resp = await openai_create(
+        model=model,
         tools=[{"type": "web_search_preview"}],
-        input=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a precise CRM data researcher. You use web search to find factual "
-                    "company information. You only extract data you are confident belongs to the "
-                    "specific company identified by name AND domain. You return only valid JSON."
-                ),
-            },
-            {"role": "user", "content": prompt},
-        ],
+        instructions=WEB_SEARCH_SYSTEM,
+        input=prompt,
+        max_output_tokens=ORG_MAX_OUTPUT_TOKENS,
     )
-    return parse_json_response(resp.output_text)
+    result = parse_json_response(resp.output_text)
+    # Only keep answers that parsed; an unusable reply is worth retrying next time
+    if result:
+        await ai_cache_set(cache_key, resp.output_text)
+    return result
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Deal summary
 # ──────────────────────────────────────────────────────────────────────────────
 
-def fetch_deal_notes(deal_id: str, headers: dict, date_from: str = "", date_to: str = "") -> list:
+async def fetch_deal_notes(deal_id: str, headers: dict, date_from: str = "", date_to: str = "") -> list:
     """Fetch up to 50 most recent notes for a deal, newest first. Optionally filter by date range."""
-    r = requests.get(
-        "https://api.pipedrive.com/v1/notes",
+    r = await pipedrive_request(
+        "GET",
+        f"{PIPEDRIVE_BASE}/notes",
         params={"deal_id": deal_id, "limit": 50, "sort": "add_time DESC"},
         headers=headers,
         timeout=30,
     )
     if r.status_code != 200:
         return []
-    notes = r.json().get("data") or []
+    notes = orjson.loads(r.content).get("data") or []
     return _filter_by_date(notes, "add_time", date_from, date_to)
 
 
@@ -453,23 +938,24 @@ def _filter_by_date(items: list, date_key: str, date_from: str, date_to: str) ->
     return result
 
 
-def fetch_deal_activities(deal_id: str, headers: dict, date_from: str = "", date_to: str = "") -> list:
+async def fetch_deal_activities(deal_id: str, headers: dict, date_from: str = "", date_to: str = "") -> list:
     """Fetch up to 50 most recent activities for a deal using v2 API. Optionally filter by date range."""
-    r = requests.get(
-        "https://api.pipedrive.com/api/v2/activities",
+    r = await pipedrive_request(
+        "GET",
+        f"{PIPEDRIVE_BASE_V2}/activities",
         params={"deal_id": deal_id, "limit": 50, "sort_by": "add_time", "sort_direction": "desc"},
         headers=headers,
         timeout=30,
     )
     if r.status_code != 200:
         return []
-    activities = r.json().get("data") or []
+    activities = orjson.loads(r.content).get("data") or []
     return _filter_by_date(activities, "due_date", date_from, date_to)
 
 
 def clean_html(text: str) -> str:
     """Strip HTML tags from note content."""
-    return re.sub(r"<[^>]+>", " ", text or "").strip()
+    return _HTML_TAG.sub(" ", text or "").strip()
 
 
 def format_notes_block(notes: list) -> str:
@@ -501,7 +987,51 @@ def format_activities_block(activities: list) -> str:
     return "\n".join(lines) if len(lines) > 1 else ""
 
 
-def ai_write_deal_summary(record: dict, notes: list, activities: list) -> str:
+DEAL_SYSTEM = (
+    "You are a precise CRM assistant writing deal briefings for sales reps. "
+    "You synthesize deal data, notes and activity history into a clear, actionable summary. "
+    "You ALWAYS include the deal value, win probability, stage, and close date when they are available. "
+    "You never invent facts."
+)
+
+DEAL_INSTR_HISTORY = (
+    "Write a 4-7 sentence deal context summary for a sales team. "
+    "Start with a one-sentence snapshot that includes the deal value, win probability, "
+    "current stage, and expected close date. "
+    "Then cover: what has happened so far, key discussion points or concerns raised, "
+    "current status, and the logical next step. "
+    "Be specific \xe2\x80\x94 reference actual dates, topics, and outcomes from the history. "
+    "Plain text only, no bullet points."
+)
+
+DEAL_INSTR_FIRST_CALL = (
+    "Write a 3-5 sentence deal context note useful before a first sales call. "
+    "Start with a one-sentence snapshot that includes the deal value, win probability, "
+    "current stage, and expected close date. "
+    "Plain text only, no bullet points."
+)
+
+DEAL_PROMPT = """
+{instruction}
+
+STRICT RULES:
+- Use only information present in the deal details and history below. Do not invent facts.
+- Do not repeat field labels verbatim (e.g. don't write "Value: 50,000 EUR" \xe2\x80\x94 write "a \xe2\x82\xac50,000 deal").
+- Do not say "according to the notes" or reference the data structure.
+- Write as a natural, useful briefing paragraph.
+{mandatory_rule}
+
+== DEAL DETAILS ==
+{deal_details}{history_section}
+"""
+
+
+def ref_name(ref, default: str = "") -> str:
+    """Name of an expanded Pipedrive reference ({"name": ...}); other values as text, or default if empty."""
+    return (ref.get("name") or "") if isinstance(ref, dict) else str(ref or default or "")
+
+
+async def ai_write_deal_summary(record: dict, notes: list, activities: list) -> str:
     title       = record.get("title", "")
     value       = record.get("value", "")
     currency    = record.get("currency", "")
@@ -510,11 +1040,11 @@ def ai_write_deal_summary(record: dict, notes: list, activities: list) -> str:
     if close_date:
         close_date = str(close_date)[:10]
     status      = record.get("status", "")
-    pipeline    = (record.get("pipeline_id") or {}).get("name", "") if isinstance(record.get("pipeline_id"), dict) else ""
-    stage       = (record.get("stage_id") or {}).get("name", "") if isinstance(record.get("stage_id"), dict) else str(record.get("stage_id") or "")
-    owner       = (record.get("owner_id") or {}).get("name", "") if isinstance(record.get("owner_id"), dict) else ""
-    org         = (record.get("org_id") or {}).get("name", "") if isinstance(record.get("org_id"), dict) else record.get("org_id") or ""
-    person      = (record.get("person_id") or {}).get("name", "") if isinstance(record.get("person_id"), dict) else record.get("person_id") or ""
+    pipeline    = ref_name(record.get("pipeline_id"))
+    stage       = ref_name(record.get("stage_id"))
+    owner       = ref_name(record.get("owner_id"))
+    org         = ref_name(record.get("org_id"))
+    person      = ref_name(record.get("person_id"))
 
     # Build deal details block—only include lines where a value exists
     detail_lines = [f"Title:        {title}"]
@@ -565,71 +1095,44 @@ def ai_write_deal_summary(record: dict, notes: list, activities: list) -> str:
         "Never omit these \xe2\x80\x94 they are the most important numbers for the sales team."
     ) if mandatory_parts else ""
 
-    if has_history:
-        instruction = (
-            "Write a 4-7 sentence deal context summary for a sales team. "
-            "Start with a one-sentence snapshot that includes the deal value, win probability, "
-            "current stage, and expected close date. "
-            "Then cover: what has happened so far, key discussion points or concerns raised, "
-            "current status, and the logical next step. "
-            "Be specific \xe2\x80\x94 reference actual dates, topics, and outcomes from the history. "
-            "Plain text only, no bullet points."
-        )
-    else:
-        instruction = (
-            "Write a 3-5 sentence deal context note useful before a first sales call. "
-            "Start with a one-sentence snapshot that includes the deal value, win probability, "
-            "current stage, and expected close date. "
-            "Plain text only, no bullet points."
-        )
-
-    prompt = f"""
-{instruction}
-
-== DEAL DETAILS ==
-{deal_details}{history_section}
-
-STRICT RULES:
-- Use only information present above. Do not invent facts.
-- Do not repeat field labels verbatim (e.g. don't write "Value: 50,000 EUR" \xe2\x80\x94 write "a \xe2\x82\xac50,000 deal").
-- Do not say "according to the notes" or reference the data structure.
-- Write as a natural, useful briefing paragraph.
-{mandatory_rule}
-""".strip()
-
-    resp = openai_client.responses.create(
-        model="gpt-4.1-mini",
-        input=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a precise CRM assistant writing deal briefings for sales reps. "
-                    "You synthesize deal data, notes and activity history into a clear, actionable summary. "
-                    "You ALWAYS include the deal value, win probability, stage, and close date when they are available. "
-                    "You never invent facts."
-                ),
-            },
-            {"role": "user", "content": prompt},
-        ],
+    prompt = DEAL_PROMPT.format(
+        instruction=DEAL_INSTR_HISTORY if has_history else DEAL_INSTR_FIRST_CALL,
+        deal_details=deal_details,
+        history_section=history_section,
+        mandatory_rule=mandatory_rule,
+    ).strip()
+
+    model  = MODEL_DEAL
+    system = DEAL_SYSTEM
+    cache_key = ai_cache_key(model, "deal", system, prompt)
+    cached = await ai_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    resp = await openai_create(
+        model=model,
+        instructions=system,
+        input=prompt,
+        temperature=0,
+        max_output_tokens=DEAL_MAX_OUTPUT_TOKENS,
     )
-    return resp.output_text.strip()
+    text = resp.output_text.strip()
+    await ai_cache_set(cache_key, text)
+    return text
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Value formatter
 # ──────────────────────────────────────────────────────────────────────────────
 
-def format_value_for_pipedrive(field_name: str, field_type: str, raw_value, industry_options: list, revenue_options: list = None):
+def format_value_for_pipedrive(field_name: str, field_type: str, raw_value, industry_index: dict[str, int], revenue_index: dict[str, int] = None):
     if raw_value is None:
         return None
 
     if field_type == "enum":
-        label = str(raw_value).strip()
-        opts = revenue_options if (field_name == "annual_revenue" and revenue_options) else industry_options
-        for opt in opts:
-            if opt.get("label", "").lower() == label.lower():
-                return opt["id"]
-        return None
+        label = str(raw_value).strip().lower()
+        index = revenue_index if (field_name == "annual_revenue" and revenue_index) else industry_index
+        return index.get(label)
 
     elif field_type == "phone":
         return [{"value": str(raw_value).strip(), "primary": True, "label": "work"}]
@@ -639,7 +1142,7 @@ def format_value_for_pipedrive(field_name: str, field_type: str, raw_value, indu
 
     elif field_type == "number":
         try:
-            cleaned = re.sub(r"[^\d.]", "", str(raw_value))
+            cleaned = _NONNUM.sub("", str(raw_value))
             return float(cleaned) if "." in cleaned else int(cleaned)
         except (ValueError, TypeError):
             return None
@@ -652,9 +1155,27 @@ def format_value_for_pipedrive(field_name: str, field_type: str, raw_value, indu
 # Routes
 # ──────────────────────────────────────────────────────────────────────────────
 
+# panel.html never changes while the process is up: read it once and let
+# browsers revalidate with the ETag instead of re-reading the file per hit.
+_panel_cache = None
+
+
+def _load_panel():
+    global _panel_cache
+    if _panel_cache is None:
+        with open("static/panel.html", "rb") as f:
+            body = f.read()
+        _panel_cache = (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+    return _panel_cache
+
+
 @app.get("/panel")
-def panel():
-    return FileResponse("static/panel.html")
+def panel(request: Request):
+    body, etag = _load_panel()
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="text/html", headers=headers)
 
 
 @app.get("/health")
@@ -679,9 +1200,12 @@ def debug_config():
 @app.get("/oauth/start")
 def oauth_start():
     if not PIPEDRIVE_CLIENT_ID:
-        return JSONResponse({"error": "Missing PIPEDRIVE_CLIENT_ID env var"}, status_code=500)
-    state = secrets.token_urlsafe(32)
-    save_oauth_state(state)
+        return ORJSONResponse({"error": "Missing PIPEDRIVE_CLIENT_ID env var"}, status_code=500)
+    state = secrets.token_urlsafe(16)  # 128 bits is plenty for a CSRF state
+    try:
+        save_oauth_state(state)
+    except Exception as e:
+        return ORJSONResponse({"error": "Could not store OAuth state", "details": str(e)}, status_code=500)
     from urllib.parse import urlencode
     params = urlencode({
         "client_id":     PIPEDRIVE_CLIENT_ID,
@@ -713,20 +1237,20 @@ def oauth_debug():
 
 
 @app.get("/oauth/callback")
-def oauth_callback(request: Request):
+async def oauth_callback(request: Request):
     code  = request.query_params.get("code")
     state = request.query_params.get("state", "")
 
-    if not state or not consume_oauth_state(state):
-        return JSONResponse({"error": "Invalid or expired state — please start again via /oauth/start."}, status_code=400)
+    if not state or not await asyncio.to_thread(consume_oauth_state, state):
+        return ORJSONResponse({"error": "Invalid or expired state — please start again via /oauth/start."}, status_code=400)
     if not code:
-        return JSONResponse({"error": "No authorisation code returned. User may have declined."}, status_code=400)
+        return ORJSONResponse({"error": "No authorisation code returned. User may have declined."}, status_code=400)
 
     client_secret = os.getenv("PIPEDRIVE_CLIENT_SECRET", "")
     if not PIPEDRIVE_CLIENT_ID or not client_secret:
-        return JSONResponse({"error": "Missing PIPEDRIVE_CLIENT_ID or PIPEDRIVE_CLIENT_SECRET env var"}, status_code=500)
+        return ORJSONResponse({"error": "Missing PIPEDRIVE_CLIENT_ID or PIPEDRIVE_CLIENT_SECRET env var"}, status_code=500)
 
-    r = requests.post(
+    r = await ASYNC_CLIENT.post(
         "https://oauth.pipedrive.com/oauth/token",
         data={
             "grant_type":    "authorization_code",
@@ -738,106 +1262,135 @@ def oauth_callback(request: Request):
         timeout=30,
     )
     if r.status_code != 200:
-        return JSONResponse({"error": "Token exchange failed", "status": r.status_code, "body": r.text}, status_code=400)
+        return ORJSONResponse({"error": "Token exchange failed", "status": r.status_code, "body": r.text}, status_code=400)
 
-    tokens        = r.json()
+    tokens        = orjson.loads(r.content)
     access_token  = tokens["access_token"]
     refresh_token = tokens["refresh_token"]
     expires_in    = tokens.get("expires_in", 3600)
 
-    me = requests.get(
-        "https://api.pipedrive.com/v1/users/me",
-        headers={"Authorization": f"Bearer {access_token}"},
+    me = await pipedrive_request(
+        "GET",
+        f"{PIPEDRIVE_BASE}/users/me",
+        headers=pd_headers(access_token),
         timeout=30,
     )
     me.raise_for_status()
-    company_id = str(me.json()["data"]["company_id"])
+    company_id = str(orjson.loads(me.content)["data"]["company_id"])
 
-    save_tokens(company_id, access_token, refresh_token, int(expires_in))
+    # Saved before answering so "Tokens saved" is true and /api/status sees them
+    try:
+        await asyncio.to_thread(save_tokens, company_id, access_token, refresh_token, int(expires_in))
+    except Exception as e:
+        return ORJSONResponse({"error": "Failed to save tokens", "details": str(e)}, status_code=500)
     return {"ok": True, "company_id": company_id, "note": "OAuth complete. Tokens saved."}
 
 
-@app.post("/api/populate")
-async def api_populate(payload: dict):
-    resource   = payload.get("resource")
-    record_id  = str(payload.get("id"))
-    company_id = str(payload.get("companyId"))
+# Identical populate requests already in flight (e.g. a double click) share one
+# pipeline instead of paying for a second set of Pipedrive and OpenAI calls.
+_inflight: dict = {}
 
-    # Normalise both spellings Pipedrive may send
-    if resource in ("organisation", "organization"):
-        resource = "organization"
 
-    if resource not in ("deal", "person", "organization"):
-        return JSONResponse({"error": "Unsupported resource"}, status_code=400)
+async def populate_record(payload: dict) -> tuple:
+    """Populate one deal or organisation. Returns (status_code, response_body)."""
+    key = tuple(str(payload.get(k) or "") for k in ("resource", "id", "companyId", "date_from", "date_to"))
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_populate_record(payload))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shield so one caller disconnecting doesn't cancel the work for the others
+    return await asyncio.shield(task)
 
+
+# Pipedrive may send either spelling
+RESOURCE_ALIASES = {"organisation": "organization"}
+
+
+async def _populate_record(payload: dict) -> tuple:
+    resource   = payload.get("resource")
+    record_id  = str(payload.get("id") or "")
+    company_id = str(payload.get("companyId") or "")
+
+    if not isinstance(resource, str):
+        return 400, {"error": "Unsupported resource"}
+    resource = RESOURCE_ALIASES.get(resource, resource)
     if resource == "person":
-        return JSONResponse(
-            {"error": "Person enrichment is not available. Only Organisation and Deal fields can be populated."},
-            status_code=400,
-        )
+        return 400, {"error": "Person enrichment is not available. Only Organisation and Deal fields can be populated."}
+
+    populate = POPULATE_HANDLERS.get(resource)
+    if populate is None:
+        return 400, {"error": "Unsupported resource"}
+
+    # Reject malformed triggers before any token lookup or Pipedrive call
+    if not record_id or not company_id:
+        return 400, {"error": "Missing record id or companyId"}
 
-    access_token = get_valid_token(company_id)
+    access_token = await asyncio.to_thread(get_valid_token, company_id)
     if not access_token:
-        return JSONResponse({"error": "Not connected or token expired. Re-authenticate via /oauth/start."}, status_code=401)
+        return 401, {"error": "Not connected or token expired. Re-authenticate via /oauth/start."}
 
-    headers      = {"Authorization": f"Bearer {access_token}"}
-    base         = "https://api.pipedrive.com/v1"
+    return await populate(payload, record_id, company_id, access_token, pd_headers(access_token))
 
-    # ── Deal ─────────────────────────────────────────────────────────────────
-    if resource == "deal":
-        r = requests.get(f"{base}/deals/{record_id}", headers=headers, timeout=30)
-        if r.status_code != 200:
-            return JSONResponse({"error": "Failed to fetch deal", "body": r.text}, status_code=400)
-        data       = r.json().get("data", {})
-        target_key = DEAL_FIELDS["deal_context"]["key"]
 
-        if not is_empty(data.get(target_key)):
-            return {"ok": True, "message": "Deal context already filled. Nothing to do."}
+async def _populate_deal(payload: dict, record_id: str, company_id: str, access_token: str, headers: dict) -> tuple:
+    status, data, body = await get_record("deals", record_id, headers, company_id)
+    if status != 200:
+        return 400, {"error": "Failed to fetch deal", "body": body}
+    target_key = DEAL_CONTEXT_KEY
 
-        # Fetch notes and activities to enrich the summary (optionally date-filtered)
-        date_from  = str(payload.get("date_from") or "")[:10]
-        date_to    = str(payload.get("date_to")   or "")[:10]
-        notes      = fetch_deal_notes(record_id, headers, date_from, date_to)
-        activities = fetch_deal_activities(record_id, headers, date_from, date_to)
+    if not is_empty(data.get(target_key)):
+        return 200, {"ok": True, "message": "Deal context already filled. Nothing to do."}
 
-        try:
-            ai_text = ai_write_deal_summary(data, notes, activities)
-        except Exception as e:
-            return JSONResponse({"error": "AI generation failed", "details": str(e)}, status_code=500)
+    # Fetch notes and activities to enrich the summary (optionally date-filtered)
+    date_from  = str(payload.get("date_from") or "")[:10]
+    date_to    = str(payload.get("date_to")   or "")[:10]
+    notes, activities = await asyncio.gather(
+        fetch_deal_notes(record_id, headers, date_from, date_to),
+        fetch_deal_activities(record_id, headers, date_from, date_to),
+    )
 
-        u = requests.put(f"{base}/deals/{record_id}", json={target_key: ai_text}, headers=headers, timeout=30)
-        if u.status_code != 200:
-            return JSONResponse({"error": "Failed to update deal", "body": u.text}, status_code=400)
-
-        has_history = bool(notes or activities)
-        source_note = " (based on notes & activity history)" if has_history else " (no history found — used deal details only)"
-        return {
-            "ok":           True,
-            "message":      f"Done. Deal context populated{source_note}.",
-            "filled_website": ["Deal Context"],
-            "filled_web":     [],
-            "not_found":      [],
-        }
+    try:
+        ai_text = await ai_write_deal_summary(data, notes, activities)
+    except APITimeoutError:
+        return 504, {"error": "AI generation timed out. Please try again."}
+    except Exception as e:
+        return 500, {"error": "AI generation failed", "details": str(e)}
+
+    u = await pipedrive_request("PUT", f"{PIPEDRIVE_BASE}/deals/{record_id}", json={target_key: ai_text}, headers=headers, timeout=30)
+    if u.status_code != 200:
+        return 400, {"error": "Failed to update deal", "body": u.text}
+    forget_record("deals", record_id, company_id)
+
+    has_history = bool(notes or activities)
+    source_note = " (based on notes & activity history)" if has_history else " (no history found — used deal details only)"
+    return 200, {
+        "ok":           True,
+        "message":      f"Done. Deal context populated{source_note}.",
+        "filled_website": [DEAL_CONTEXT_LABEL],
+        "filled_web":     [],
+        "not_found":      [],
+    }
 
-    # ── Organisation ─────────────────────────────────────────────────────────
-    r = requests.get(f"{base}/organizations/{record_id}", headers=headers, timeout=30)
-    if r.status_code != 200:
-        return JSONResponse({
-            "error": f"Pipedrive returned HTTP {r.status_code} when fetching the organisation. "
-                      "If this is a 401, your token has expired - re-authenticate via /oauth/start.",
-            "body": r.text[:300],
-        }, status_code=400)
 
-    data = r.json().get("data", {})
+async def _populate_organization(payload: dict, record_id: str, company_id: str, access_token: str, headers: dict) -> tuple:
+    # Warm the enum options cache while the record is in flight
+    (status, data, body), _ = await asyncio.gather(
+        get_record("organizations", record_id, headers, company_id),
+        prefetch_enum_options(access_token, company_id),
+    )
+    if status != 200:
+        return 400, {
+            "error": f"Pipedrive returned HTTP {status} when fetching the organisation. "
+                      "If this is a 401, your token has expired - re-authenticate via /oauth/start.",
+            "body": body[:300],
+        }
 
     # Which fields need filling?
-    fields_to_fill = [
-        name for name, info in ORG_FIELDS.items()
-        if is_empty(data.get(info["key"]))
-    ]
+    fields_to_fill = [name for name, key in ORG_FIELD_ITEMS if is_empty(data.get(key))]
 
     if not fields_to_fill:
-        return {"ok": True, "message": "All fields already filled. Nothing to do."}
+        return 200, {"ok": True, "message": "All fields already filled. Nothing to do."}
 
     # Get website URL and domain
     website_url = data.get("website") or ""
@@ -845,172 +1398,202 @@ async def api_populate(payload: dict):
         website_url = website_url[0].get("value", "") if website_url else ""
 
     if not website_url:
-        return JSONResponse(
-            {"error": "No website found on this organisation record. Please add one first."},
-            status_code=400,
-        )
+        return 400, {"error": "No website found on this organisation record. Please add one first."}
 
     # Extract domain for anchoring web searches (e.g. "eaces.de")
-    domain_match = re.search(r"https?://(?:www\.)?([^/]+)", website_url)
+    domain_match = _DOMAIN.search(website_url)
     domain = domain_match.group(1) if domain_match else website_url
 
-    # Fetch industry options if needed
-    industry_options = []
-    if "industry" in fields_to_fill:
-        industry_options = get_industry_options(access_token)
-    revenue_options = []
-    if "annual_revenue" in fields_to_fill:
-        revenue_options = get_enum_options(access_token, "annual_revenue")
-
     org_name = data.get("name", "")
 
-    # ── PASS 1: extract from website ─────────────────────────────────────────
-    website_text = fetch_website_text(website_url)
-    if not website_text or len(website_text) < 100:
-        return JSONResponse(
-            {"error": f"Could not read content from {website_url}. The site may block requests or require JavaScript."},
-            status_code=400,
-        )
-
-    try:
-        extracted = ai_extract_from_website(
+    # The web-search pass never depends on the scraped text, so start it now
+    # for every searchable gap instead of waiting for pass 1 to finish; only
+    # the fields pass 1 leaves empty are taken from its answer.
+    web_fields = [f for f in fields_to_fill if f in WEB_SEARCHABLE]
+    web_task = None
+    if SPECULATIVE_WEB_SEARCH and web_fields:
+        web_task = asyncio.ensure_future(ai_extract_from_web(
             name=org_name,
             website_url=website_url,
-            website_text=website_text,
-            fields=fields_to_fill,
-            industry_options=industry_options,
-            revenue_options=revenue_options,
+            domain=domain,
+            fields=web_fields,
+            industry_options=[],
+        ))
+        # Retrieve the exception if the result is discarded, so it isn't logged as unhandled
+        web_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    # Whatever path we leave by (early return, exception, or pass 1 finding
+    # everything), an unused speculative search must not keep running
+    try:
+        # Scrape the website and fetch any needed enum options concurrently
+        async def enum_options(field_key: str) -> tuple:
+            if field_key not in fields_to_fill:
+                return [], {}
+            return await _load_enum_options(access_token, field_key, company_id)
+
+        website_text, (industry_options, industry_index), (revenue_options, revenue_index) = await asyncio.gather(
+            fetch_website_text(website_url),
+            enum_options("industry"),
+            enum_options("annual_revenue"),
         )
-    except Exception as e:
-        return JSONResponse({"error": "AI extraction (website) failed", "details": str(e)}, status_code=500)
-
-    # Which fields are still missing after pass 1?
-    still_missing = [
-        f for f in fields_to_fill
-        if extracted.get(f) is None and ORG_FIELDS[f].get("web_searchable")
-    ]
+        if not website_text or len(website_text) < 100:
+            return 400, {"error": f"Could not read content from {website_url}. The site may block requests or require JavaScript."}
 
-    # ── PASS 2: web search for remaining fields ───────────────────────────────
-    web_extracted = {}
-    if still_missing:
+        # ── PASS 1: extract from website ─────────────────────────────────────────
         try:
-            web_extracted = ai_extract_from_web(
+            extracted = await ai_extract_from_website(
                 name=org_name,
                 website_url=website_url,
-                domain=domain,
-                fields=still_missing,
+                website_text=website_text,
+                fields=fields_to_fill,
                 industry_options=industry_options,
                 revenue_options=revenue_options,
             )
-        except Exception:
-            pass  # web search is best-effort — don't fail the whole request
-
-    # Merge: website data takes priority, web search fills the gaps
-    for f in still_missing:
-        if web_extracted.get(f) is not None and extracted.get(f) is None:
-            extracted[f] = web_extracted[f]
-
-    # ── Build Pipedrive update payload ────────────────────────────────────────
-    update_payload = {}
-    filled_website = []
-    filled_web     = []
-    not_found      = []
-
-    for field_name in fields_to_fill:
-        raw_value = extracted.get(field_name)
-        if raw_value is None:
-            not_found.append(ORG_FIELDS[field_name]["label"])
-            continue
+        except APITimeoutError:
+            return 504, {"error": "AI extraction (website) timed out. Please try again."}
+        except Exception as e:
+            return 500, {"error": "AI extraction (website) failed", "details": str(e)}
+
+        # Which fields are still missing after pass 1?
+        still_missing = [f for f in fields_to_fill if f in WEB_SEARCHABLE and extracted.get(f) is None]
+
+        # ── PASS 2: web search for remaining fields ───────────────────────────────
+        web_extracted = {}
+        if still_missing:
+            try:
+                if web_task:
+                    web_extracted = await web_task
+                else:
+                    web_extracted = await ai_extract_from_web(
+                        name=org_name,
+                        website_url=website_url,
+                        domain=domain,
+                        fields=still_missing,
+                        industry_options=industry_options,
+                        revenue_options=revenue_options,
+                    )
+            except Exception:
+                pass  # web search is best-effort — don't fail the whole request
+
+        # Merge: website data takes priority, web search fills the gaps
+        for f in still_missing:
+            if web_extracted.get(f) is not None and extracted.get(f) is None:
+                extracted[f] = web_extracted[f]
+
+        # ── Build Pipedrive update payload ────────────────────────────────────────
+        update_payload = {}
+        filled_website = []
+        filled_web     = []
+        not_found      = []
+        from_web       = {f for f in still_missing if web_extracted.get(f) is not None}
+
+        for field_name in fields_to_fill:
+            key, label, ftype = FIELD_META[field_name]
+            raw_value = extracted.get(field_name)
+            if raw_value is None:
+                not_found.append(label)
+                continue
+
+            formatted = format_value_for_pipedrive(
+                field_name,
+                ftype,
+                raw_value,
+                industry_index,
+                revenue_index,
+            )
+            if formatted is None:
+                not_found.append(label)
+                continue
 
-        formatted = format_value_for_pipedrive(
-            field_name,
-            ORG_FIELDS[field_name]["type"],
-            raw_value,
-            industry_options,
-            revenue_options,
+            update_payload[key] = formatted
+            if field_name in from_web:
+                filled_web.append(label)
+            else:
+                filled_website.append(label)
+
+        if not update_payload:
+            return 200, {"ok": True, "message": f"No data found for: {', '.join(not_found)}."}
+
+        # Write to Pipedrive
+        u = await pipedrive_request(
+            "PUT",
+            f"{PIPEDRIVE_BASE}/organizations/{record_id}",
+            json=update_payload,
+            headers=headers,
+            timeout=30,
         )
-        if formatted is None:
-            not_found.append(ORG_FIELDS[field_name]["label"])
-            continue
+        if u.status_code != 200:
+            return 400, {"error": "Failed to update organisation", "body": u.text}
+        forget_record("organizations", record_id, company_id)
+
+        # Build a clear, informative message
+        parts = []
+        if filled_website:
+            parts.append(f"From website: {', '.join(filled_website)}")
+        if filled_web:
+            parts.append(f"From web search: {', '.join(filled_web)}")
+        if not_found:
+            parts.append(f"Not found: {', '.join(not_found)}")
+
+        total = len(filled_website) + len(filled_web)
+        return 200, {
+            "ok": True,
+            "message": f"{total} field{'s' if total != 1 else ''} populated. {'. '.join(parts)}.",
+            "filled_website": filled_website,
+            "filled_web":     filled_web,
+            "not_found":      not_found,
+        }
+    finally:
+        if web_task:
+            web_task.cancel()  # no-op once it has finished
 
-        update_payload[ORG_FIELDS[field_name]["key"]] = formatted
-        label = ORG_FIELDS[field_name]["label"]
-        if field_name in still_missing and web_extracted.get(field_name) is not None:
-            filled_web.append(label)
-        else:
-            filled_website.append(label)
 
-    if not update_payload:
-        return {"ok": True, "message": f"No data found for: {', '.join(not_found)}."}
+POPULATE_HANDLERS = {
+    "deal":         _populate_deal,
+    "organization": _populate_organization,
+}
 
-    # Write to Pipedrive
-    u = requests.put(
-        f"{base}/organizations/{record_id}",
-        json=update_payload,
-        headers=headers,
-        timeout=30,
-    )
-    if u.status_code != 200:
-        return JSONResponse({"error": "Failed to update organisation", "body": u.text}, status_code=400)
 
-    # Build a clear, informative message
-    parts = []
-    if filled_website:
-        parts.append(f"From website: {', '.join(filled_website)}")
-    if filled_web:
-        parts.append(f"From web search: {', '.join(filled_web)}")
-    if not_found:
-        parts.append(f"Not found: {', '.join(not_found)}")
-
-    total = len(filled_website) + len(filled_web)
-    return {
-        "ok": True,
-        "message": f"{total} field{'s' if total != 1 else ''} populated. " + ". ".join(parts) + ".",
-        "filled_website": filled_website,
-        "filled_web":     filled_web,
-        "not_found":      not_found,
-    }
+@app.post("/api/populate")
+async def api_populate(payload: dict):
+    status, body = await populate_record(payload)
+    return body if status == 200 else ORJSONResponse(body, status_code=status)
 
 
-@app.post("/api/chat")
-async def api_chat(payload: dict):
+@app.post("/api/populate_batch")
+async def api_populate_batch(payload: dict):
     """
-    Lightweight chat proxy. Receives:
-      - messages: list of {role, content} (full history)
-      - context:  optional deal/org context string prepended as system context
-      - companyId: for auth check
-    Returns: {reply: str}
+    Populate several records concurrently. Receives:
+      - items:     [{resource, id, date_from?, date_to?}]
+      - companyId: shared by every item
+    Returns: {results: [{id, status, ...populate response}]}
     """
-    company_id = str(payload.get("companyId", ""))
-    messages   = payload.get("messages", [])
-    context    = payload.get("context", "").strip()
-
-    if not messages:
-        return JSONResponse({"error": "No messages provided"}, status_code=400)
-
-    # Optional: verify company has a valid token (soft check, don't block chat)
-    tokens = load_tokens(company_id) if company_id else None
-
-    system_content = (
-        "You are a helpful sales assistant embedded inside Pipedrive CRM. "
-        "You help sales reps understand their deals, draft emails, prepare for calls, "
-        "and answer questions about contacts and organisations. "
-        "Be concise and practical. Use plain text unless the user asks for formatting."
-    )
-    if context:
-        system_content += f"\n\n== CURRENT RECORD CONTEXT ==\n{context}"
-
-    try:
-        resp = openai_client.responses.create(
-            model="gpt-4.1-mini",
-            input=[
-                {"role": "system", "content": system_content},
-                *messages,
-            ],
-        )
-        return {"reply": resp.output_text.strip()}
-    except Exception as e:
-        return JSONResponse({"error": "AI request failed", "details": str(e)}, status_code=500)
+    items      = payload.get("items") or []
+    company_id = payload.get("companyId")
+    if not items:
+        return ORJSONResponse({"error": "No items provided"}, status_code=400)
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return ORJSONResponse({"error": "items must be a list of objects"}, status_code=400)
+    if len(items) > BATCH_MAX_ITEMS:
+        return ORJSONResponse({"error": f"Too many items (max {BATCH_MAX_ITEMS})"}, status_code=400)
+
+    # Bound the fan-out per batch so one large bulk action can't take every
+    # Pipedrive/OpenAI slot away from interactive requests
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def populate_one(item: dict) -> tuple:
+        async with sem:
+            return await populate_record({**item, "companyId": company_id})
+
+    outcomes = await asyncio.gather(*(populate_one(item) for item in items), return_exceptions=True)
+    results = []
+    for item, outcome in zip(items, outcomes):
+        # One failing record shouldn't sink the rest of the batch
+        if isinstance(outcome, Exception):
+            outcome = (500, {"error": "Populate failed", "details": str(outcome)})
+        status, body = outcome
+        results.append({"id": item.get("id"), "status": status, **body})
+    return {"results": results}
 
 
 @app.post("/api/context")
@@ -1023,22 +1606,25 @@ async def api_context(payload: dict):
     record_id  = str(payload.get("id", ""))
     company_id = str(payload.get("companyId", ""))
 
-    if resource in ("organisation", "organization"):
-        resource = "organization"
+    # Anything but a string is an unknown resource (and unhashable lists/dicts would raise)
+    resource = RESOURCE_ALIASES.get(resource, resource) if isinstance(resource, str) else ""
 
-    access_token = get_valid_token(company_id)
+    access_token = await asyncio.to_thread(get_valid_token, company_id)
     if not access_token:
         return {"context": ""}
 
-    headers = {"Authorization": f"Bearer {access_token}"}
-    base    = "https://api.pipedrive.com/v1"
+    headers = pd_headers(access_token)
     lines   = []
 
     try:
         if resource == "deal":
-            r = requests.get(f"{base}/deals/{record_id}", headers=headers, timeout=15)
-            if r.status_code == 200:
-                d = r.json().get("data", {})
+            # Deal, notes and activities are independent — fetch them together
+            (status, d, _), notes, acts = await asyncio.gather(
+                get_record("deals", record_id, headers, company_id, timeout=15),
+                fetch_deal_notes(record_id, headers),
+                fetch_deal_activities(record_id, headers),
+            )
+            if status == 200:
                 lines.append(f"Record type: Deal")
                 if d.get("title"):       lines.append(f"Title: {d['title']}")
                 if d.get("value"):       lines.append(f"Value: {d['value']} {d.get('currency','')}")
@@ -1055,21 +1641,18 @@ async def api_context(payload: dict):
                 owner = d.get("owner_id")
                 if isinstance(owner, dict): lines.append(f"Owner: {owner.get('name','')}")
                 # Custom deal context field
-                ctx_key = DEAL_FIELDS["deal_context"]["key"]
-                if d.get(ctx_key): lines.append(f"\nDeal context:\n{d[ctx_key]}")
+                deal_context = d.get(DEAL_CONTEXT_KEY)
+                if deal_context: lines.append(f"\nDeal context:\n{deal_context}")
                 # Recent notes
-                notes = fetch_deal_notes(record_id, headers)
                 nb = format_notes_block(notes)
                 if nb: lines.append("\n" + nb)
                 # Recent activities
-                acts = fetch_deal_activities(record_id, headers)
                 ab = format_activities_block(acts)
                 if ab: lines.append("\n" + ab)
 
         elif resource == "organization":
-            r = requests.get(f"{base}/organizations/{record_id}", headers=headers, timeout=15)
-            if r.status_code == 200:
-                d = r.json().get("data", {})
+            status, d, _ = await get_record("organizations", record_id, headers, company_id, timeout=15)
+            if status == 200:
                 lines.append(f"Record type: Organisation")
                 if d.get("name"):    lines.append(f"Name: {d['name']}")
                 if d.get("address"): lines.append(f"Address: {d['address']}")
@@ -1077,18 +1660,27 @@ async def api_context(payload: dict):
                 if isinstance(website, list): website = website[0].get("value","") if website else ""
                 if website: lines.append(f"Website: {website}")
                 # Custom fields
-                for fname, finfo in ORG_FIELDS.items():
-                    val = d.get(finfo["key"])
-                    if val and fname not in ("address",):
+                for key, label in CONTEXT_FIELDS:
+                    val = d.get(key)
+                    if val:
                         if isinstance(val, list):
                             val = ", ".join(v.get("value","") for v in val if isinstance(v,dict))
-                        if val: lines.append(f"{finfo['label']}: {val}")
+                        if val: lines.append(f"{label}: {val}")
     except Exception:
         pass
 
     return {"context": "\n".join(lines)}
 
 
+CHAT_SYSTEM = (
+    "You are a helpful sales assistant embedded inside Pipedrive CRM. "
+    "You help sales reps understand their deals and organisations, draft emails, "
+    "prepare for calls, and answer questions. "
+    "Be concise and practical. Use plain text unless the user asks for formatting. "
+    "When drafting emails, write the full email including a subject line."
+)
+
+
 @app.post("/api/chat")
 async def api_chat(payload: dict):
     """
@@ -1096,36 +1688,50 @@ async def api_chat(payload: dict):
       - messages:  [{role, content}]  full conversation history
       - context:   optional CRM context string prepended as system context
       - companyId: for logging/auth
-    Returns: {reply: str}
+      - stream:    optional; stream the reply as plain text while it is generated
+    Returns: {reply: str}, or a text/plain stream when stream is set
     """
     messages   = payload.get("messages", [])
     context    = (payload.get("context") or "").strip()
     company_id = str(payload.get("companyId", ""))
 
     if not messages:
-        return JSONResponse({"error": "No messages provided"}, status_code=400)
-
-    system = (
-        "You are a helpful sales assistant embedded inside Pipedrive CRM. "
-        "You help sales reps understand their deals and organisations, draft emails, "
-        "prepare for calls, and answer questions. "
-        "Be concise and practical. Use plain text unless the user asks for formatting. "
-        "When drafting emails, write the full email including a subject line."
-    )
-    if context:
-        system += f"\n\n== CURRENT RECORD ==\n{context}"
+        return ORJSONResponse({"error": "No messages provided"}, status_code=400)
+
+    system = CHAT_SYSTEM + f"\n\n== CURRENT RECORD ==\n{context}" if context else CHAT_SYSTEM
+
+    if payload.get("stream"):
+        deltas = openai_stream_text(model=MODEL_CHAT, instructions=system, input=messages)
+        # Pull the first delta before committing to a 200 so auth/model errors still come back as JSON
+        try:
+            first = await deltas.__anext__()
+        except StopAsyncIteration:
+            first = ""
+        except Exception as e:
+            return ORJSONResponse({"error": "AI request failed", "details": str(e)}, status_code=500)
+
+        async def relay():
+            try:
+                yield first
+                async for delta in deltas:
+                    yield delta
+            except OpenAIStreamError as e:
+                # Headers are already sent, so flag the failure in the text itself
+                yield f"\n\n[Reply interrupted: {e}]"
+            finally:
+                await deltas.aclose()
+
+        return StreamingResponse(relay(), media_type="text/plain; charset=utf-8")
 
     try:
-        resp = openai_client.responses.create(
-            model="gpt-4.1-mini",
-            input=[
-                {"role": "system", "content": system},
-                *messages,
-            ],
+        resp = await openai_create(
+            model=MODEL_CHAT,
+            instructions=system,
+            input=messages,
         )
         return {"reply": resp.output_text.strip()}
     except Exception as e:
-        return JSONResponse({"error": "AI request failed", "details": str(e)}, status_code=500)
+        return ORJSONResponse({"error": "AI request failed", "details": str(e)}, status_code=500)
 
 
 @app.get("/api/status")
@@ -1136,7 +1742,7 @@ async def api_status(companyId: str = ""):
     """
     if not companyId:
         return {"connected": False}
-    token = get_valid_token(companyId)
+    token = await asyncio.to_thread(get_valid_token, companyId)
     return {"connected": bool(token)}
 
 